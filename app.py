@@ -3,23 +3,31 @@ Social Contract - Accountability Challenge App
 Refactored to use SQLAlchemy ORM and Cloudinary for image storage
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, g, abort, has_request_context, copy_current_request_context
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.datastructures import FileStorage
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_migrate import Migrate
 from authlib.integrations.flask_client import OAuth
-from sqlalchemy.orm import joinedload, selectinload
-from functools import wraps
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, contains_eager, load_only
+from sqlalchemy.dialects import postgresql, sqlite
+from functools import wraps, lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import os
+import shutil
+import tempfile
 import re
 import random
 import string
 import secrets
+import threading
 import hashlib
 import json
 import logging
+import time
 from datetime import datetime, timedelta, date, timezone as tz
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from dotenv import load_dotenv
@@ -28,7 +36,7 @@ from markupsafe import Markup
 from models import (
     db, User, Challenge, ChallengeMember, Checkin, CheckinReaction,
     Achievement, UserAchievement, Notification, ChallengeComment, Nudge,
-    PageViewEvent, WebVitalEvent, seed_achievements
+    PageViewEvent, WebVitalEvent, ensure_indexes
 )
 from cloudinary_helper import (
     init_cloudinary, upload_profile_photo, upload_checkin_photo,
@@ -75,6 +83,17 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'pool_pre_ping': True,  # Test connections before using them
 }
+if database_url:
+    # Server databases get a sized QueuePool; SQLite keeps its default pool.
+    # Each gunicorn worker holds its own pool, so keep
+    # (pool_size + max_overflow) * workers below Postgres max_connections.
+    # Connections are recycled just under the common 300s NAT/LB idle timeout.
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update({
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '280')),
+    })
 
 # Initialize extensions
 db.init_app(app)
@@ -86,6 +105,32 @@ cloudinary_configured = init_cloudinary()
 if not cloudinary_configured:
     logger.warning('Cloudinary not configured - photo uploads will be disabled')
 
+# --- Background Tasks ---
+# Slow external calls (Cloudinary uploads) run here so the request can return first.
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', '4'))
+_background = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='bg')
+
+
+def run_in_background(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on the background pool.
+
+    Submitted during a request, the task runs in a copy of the request
+    context so url_for and session still work; otherwise in an app context.
+    """
+    def task():
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.exception(f'Background task {fn.__name__} failed')
+
+    if has_request_context():
+        return _background.submit(copy_current_request_context(task))
+
+    def task_in_app_context():
+        with app.app_context():
+            task()
+    return _background.submit(task_in_app_context)
+
 # --- Google OAuth Setup ---
 oauth = OAuth(app)
 google = oauth.register(
@@ -101,11 +146,24 @@ google = oauth.register(
 # Exempt OAuth callback from CSRF (Google redirects don't carry tokens)
 csrf.exempt('auth_google_callback')
 
+# Rate limit counters must be shared across gunicorn workers, so use Redis when
+# REDIS_URL is set. Local dev falls back to per-process in-memory storage.
+# On Redis every strategy runs as a single atomic Lua script per hit:
+# fixed-window (INCR + EXPIRE) is cheapest, sliding-window-counter weights the
+# previous window's counter to smooth boundary bursts at the same O(1) cost,
+# and moving-window (sorted set trim + count + insert) is exact.
+RATELIMIT_STRATEGIES = {'fixed-window', 'sliding-window-counter', 'moving-window'}
+ratelimit_strategy = os.environ.get('RATELIMIT_STRATEGY', 'fixed-window')
+if ratelimit_strategy not in RATELIMIT_STRATEGIES:
+    logger.warning(f'Unknown RATELIMIT_STRATEGY {ratelimit_strategy!r} - using fixed-window')
+    ratelimit_strategy = 'fixed-window'
+
 limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=[],
-    storage_uri="memory://",
+    storage_uri=os.environ.get('REDIS_URL', 'memory://'),
+    strategy=ratelimit_strategy,
 )
 
 
@@ -118,6 +176,15 @@ TRACKING_COUNTRY_HEADERS = [
 
 WEB_VITALS_ALLOWED = {'FCP', 'LCP', 'CLS', 'INP', 'TTFB'}
 
+# Pinned to Werkzeug's current default (scrypt N=2^15, r=8, p=1) so hashing cost
+# doesn't drift with library upgrades. Existing hashes keep verifying with the
+# parameters stored in them.
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+USERNAME_SANITIZE_RE = re.compile(r'[^a-z0-9_]')
+DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
 
 # --- Security Headers ---
 @app.after_request
@@ -186,12 +253,13 @@ def track_page_view(response):
 
 
 # --- Image validation ---
+# Keyed by the first three bytes (where all supported formats already differ),
+# mapping to the format and the full signatures accepted for it.
 IMAGE_SIGNATURES = {
-    b'\x89PNG\r\n\x1a\n': 'png',
-    b'\xff\xd8\xff': 'jpg',
-    b'GIF87a': 'gif',
-    b'GIF89a': 'gif',
-    b'RIFF': 'webp',
+    b'\x89PN': ('png', (b'\x89PNG\r\n\x1a\n',)),
+    b'\xff\xd8\xff': ('jpg', (b'\xff\xd8\xff',)),
+    b'GIF': ('gif', (b'GIF87a', b'GIF89a')),
+    b'RIF': ('webp', (b'RIFF',)),
 }
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
@@ -207,20 +275,53 @@ def validate_image_file(file_storage):
     """Read magic bytes to verify the file is actually an image."""
     header = file_storage.read(12)
     file_storage.seek(0)
-    if not header:
+    match = IMAGE_SIGNATURES.get(header[:3])
+    if not match:
         return False
-    for signature, fmt in IMAGE_SIGNATURES.items():
-        if header.startswith(signature):
-            if fmt == 'webp':
-                return header[8:12] == b'WEBP'
-            return True
-    return False
+    fmt, signatures = match
+    if not header.startswith(signatures):
+        return False
+    if fmt == 'webp':
+        return header[8:12] == b'WEBP'
+    return True
 
 
 # --- Helper Functions ---
 
+def row_exists(query):
+    """Return True if the query matches any row, using SELECT EXISTS(...)."""
+    return db.session.query(query.exists()).scalar()
+
+
+def get_challenge_membership(challenge_id, user_id):
+    """The user's ChallengeMember (challenge eager-loaded) or None, memoized on g for the request."""
+    memberships = g.setdefault('memberships', {})
+    key = (challenge_id, user_id)
+    if key not in memberships:
+        memberships[key] = ChallengeMember.query.options(
+            joinedload(ChallengeMember.challenge)
+        ).filter_by(challenge_id=challenge_id, user_id=user_id).first()
+    return memberships[key]
+
+
+def ranked_members(challenge_id):
+    """Challenge members with their users, in leaderboard order (sorted by the DB)."""
+    return ChallengeMember.query.options(
+        joinedload(ChallengeMember.user).load_only(
+            User.display_name, User.username, User.profile_photo
+        )
+    ).filter_by(challenge_id=challenge_id).order_by(
+        ChallengeMember.points.desc(),
+        ChallengeMember.current_streak.desc()
+    ).all()
+
+
+JOIN_CODE_ALPHABET = string.ascii_uppercase + string.digits
+JOIN_CODE_BATCH = 5
+
+
 def generate_join_code():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    return ''.join(random.choices(JOIN_CODE_ALPHABET, k=6))
 
 
 def safe_initial(name):
@@ -237,7 +338,9 @@ def render_avatar(display_name, photo_url=None, css_class='user-avatar'):
     if photo_url:
         # Use Cloudinary URL optimization if it's a Cloudinary URL
         optimized_url = get_optimized_url(photo_url, width=80, height=80, crop='fill')
-        return Markup(f'<img src="{optimized_url}" alt="{safe_initial(display_name)}" class="{css_class} avatar-img">')
+        retina_url = get_optimized_url(photo_url, width=80, height=80, crop='fill', dpr=2.0)
+        srcset = f' srcset="{optimized_url} 1x, {retina_url} 2x"' if retina_url != optimized_url else ''
+        return Markup(f'<img src="{optimized_url}"{srcset} alt="{safe_initial(display_name)}" class="{css_class} avatar-img">')
     initial = safe_initial(display_name)
     return Markup(f'<div class="{css_class}">{initial}</div>')
 
@@ -280,34 +383,53 @@ def get_hashed_ip():
     return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
 
+@lru_cache(maxsize=2048)
+def _zi(tz_name):
+    """Return a cached ZoneInfo for an IANA timezone name."""
+    return ZoneInfo(tz_name)
+
+
+@lru_cache(maxsize=2048)
 def validate_timezone(tz_name):
     """Return a valid IANA timezone name or 'UTC' as fallback."""
     if not tz_name or not isinstance(tz_name, str):
         return 'UTC'
     try:
-        ZoneInfo(tz_name)
+        _zi(tz_name)
         return tz_name
     except (ZoneInfoNotFoundError, KeyError):
         return 'UTC'
 
 
+def request_timezone():
+    """Resolve the session's timezone once per request."""
+    if 'user_tz' not in g:
+        g.user_tz = _zi(validate_timezone(session.get('timezone', 'UTC')))
+    return g.user_tz
+
+
+def resolve_timezone(tz_name=None):
+    """Return the ZoneInfo for tz_name, or the session's timezone if not given."""
+    if not tz_name:
+        return request_timezone()
+    return _zi(validate_timezone(tz_name))
+
+
 def get_user_today(tz_name=None):
     """Get today's date in the user's timezone. Falls back to session, then UTC."""
-    if not tz_name:
-        tz_name = session.get('timezone', 'UTC')
-    tz_name = validate_timezone(tz_name)
-    now_utc = datetime.now(tz.utc)
-    user_now = now_utc.astimezone(ZoneInfo(tz_name))
-    return user_now.date()
+    return datetime.now(resolve_timezone(tz_name)).date()
 
 
 def get_user_now(tz_name=None):
     """Get the current datetime in the user's timezone."""
-    if not tz_name:
-        tz_name = session.get('timezone', 'UTC')
-    tz_name = validate_timezone(tz_name)
-    now_utc = datetime.now(tz.utc)
-    return now_utc.astimezone(ZoneInfo(tz_name))
+    return datetime.now(resolve_timezone(tz_name))
+
+
+def request_utc_now():
+    """Current UTC time, computed once per request so list renders share it."""
+    if 'utc_now' not in g:
+        g.utc_now = datetime.now(tz.utc)
+    return g.utc_now
 
 
 def time_ago(dt):
@@ -324,8 +446,7 @@ def time_ago(dt):
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=tz.utc)
 
-    now = datetime.now(tz.utc)
-    diff = now - dt
+    diff = request_utc_now() - dt
 
     seconds = diff.total_seconds()
     if seconds < 60:
@@ -360,6 +481,71 @@ def create_notification(user_id, notif_type, title, message, link=None, commit=T
         db.session.commit()
 
 
+def notification_row(user_id, notif_type, title, message, link=None):
+    """Build a Notification mapping for bulk_insert_mappings."""
+    return {
+        'user_id': user_id,
+        'type': notif_type,
+        'title': title,
+        'message': message,
+        'link': link,
+    }
+
+
+UPLOAD_SPOOL_MAX = 512 * 1024  # bytes held in memory before spilling to disk
+
+
+def buffer_upload(file_storage):
+    """Copy an upload so it outlives the request, spilling large files to a temp file."""
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX)
+    shutil.copyfileobj(file_storage.stream, spool)
+    spool.seek(0)
+    return FileStorage(
+        stream=spool,
+        filename=file_storage.filename,
+        content_type=file_storage.content_type,
+    )
+
+
+def attach_checkin_photo(checkin_id, photo, challenge_id, user_id, checkin_date):
+    """Upload a check-in photo and store its URL on the check-in."""
+    try:
+        photo_url = upload_checkin_photo(photo, challenge_id, user_id, checkin_date)
+    finally:
+        photo.close()
+    if not photo_url:
+        logger.warning(f'Failed to upload checkin photo for user {user_id}')
+        return
+    Checkin.query.filter_by(id=checkin_id).update(
+        {'photo_url': photo_url}, synchronize_session=False
+    )
+    db.session.commit()
+
+    # Photo achievements can only be judged once the URL is stored
+    queue_achievement_check(user_id)
+
+
+_ACHIEVEMENTS_CACHE = None
+
+
+def _all_achievements():
+    """Return the seeded achievements, loaded from the database once per process."""
+    global _ACHIEVEMENTS_CACHE
+    if _ACHIEVEMENTS_CACHE is None:
+        rows = [{
+            'id': a.id,
+            'name': a.name,
+            'description': a.description,
+            'condition_type': a.condition_type,
+            'condition_value': a.condition_value,
+        } for a in Achievement.query.all()]
+        if not rows:
+            # Not seeded yet - don't cache the empty result
+            return rows
+        _ACHIEVEMENTS_CACHE = rows
+    return _ACHIEVEMENTS_CACHE
+
+
 def check_achievements(user_id):
     """Check and award any earned achievements for a user."""
     user = User.query.get(user_id)
@@ -367,19 +553,27 @@ def check_achievements(user_id):
         return
 
     # Get achievements user hasn't earned yet
-    earned_ids = [ua.achievement_id for ua in user.achievements]
-    unearned = Achievement.query.filter(~Achievement.id.in_(earned_ids) if earned_ids else True).all()
+    earned_ids = {row.achievement_id for row in UserAchievement.query.with_entities(
+        UserAchievement.achievement_id
+    ).filter_by(user_id=user_id).all()}
+    unearned = [a for a in _all_achievements() if a['id'] not in earned_ids]
 
     if not unearned:
         return
 
-    # Calculate stats
-    total_checkins = Checkin.query.filter_by(user_id=user_id).count()
-    best_streak = db.session.query(db.func.max(ChallengeMember.best_streak)).filter_by(user_id=user_id).scalar() or 0
-    total_points = db.session.query(db.func.sum(ChallengeMember.points)).filter_by(user_id=user_id).scalar() or 0
-    challenges_joined = ChallengeMember.query.filter_by(user_id=user_id).count()
-    challenges_created = Challenge.query.filter_by(creator_id=user_id).count()
-    photo_checkins = Checkin.query.filter(Checkin.user_id == user_id, Checkin.photo_url.isnot(None)).count()
+    # Calculate all stats in a single round-trip
+    checkins = db.session.query(Checkin).filter(Checkin.user_id == user_id)
+    members = db.session.query(ChallengeMember).filter(ChallengeMember.user_id == user_id)
+
+    (total_checkins, photo_checkins, challenges_joined, total_points,
+     best_streak, challenges_created) = db.session.query(
+        checkins.with_entities(db.func.count(Checkin.id)).scalar_subquery(),
+        checkins.with_entities(db.func.count(Checkin.photo_url)).scalar_subquery(),
+        members.with_entities(db.func.count(ChallengeMember.id)).scalar_subquery(),
+        members.with_entities(db.func.coalesce(db.func.sum(ChallengeMember.points), 0)).scalar_subquery(),
+        members.with_entities(db.func.coalesce(db.func.max(ChallengeMember.best_streak), 0)).scalar_subquery(),
+        Challenge.query.filter_by(creator_id=user_id).with_entities(db.func.count(Challenge.id)).scalar_subquery()
+    ).one()
 
     stat_map = {
         'total_checkins': total_checkins,
@@ -390,56 +584,102 @@ def check_achievements(user_id):
         'photo_checkins': photo_checkins,
     }
 
-    for achievement in unearned:
-        if achievement.condition_type in stat_map:
-            if stat_map[achievement.condition_type] >= achievement.condition_value:
-                user_achievement = UserAchievement(
-                    user_id=user_id,
-                    achievement_id=achievement.id
-                )
-                db.session.add(user_achievement)
-                create_notification(
-                    user_id, 'achievement_earned',
-                    'Achievement Unlocked',
-                    f'You earned "{achievement.name}" - {achievement.description}',
-                    url_for('achievements_page'),
-                    commit=False
-                )
+    earned = [
+        a for a in unearned
+        if a['condition_type'] in stat_map
+        and stat_map[a['condition_type']] >= a['condition_value']
+    ]
+    if not earned:
+        return
 
+    # Skip awards an overlapping check (another thread or worker) inserted
+    # first; only the rows inserted here get a notification
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    inserted_ids = set(db.session.execute(
+        dialect.insert(UserAchievement).values([
+            {'user_id': user_id, 'achievement_id': a['id']} for a in earned
+        ])
+        .on_conflict_do_nothing(index_elements=['user_id', 'achievement_id'])
+        .returning(UserAchievement.achievement_id)
+    ).scalars())
+
+    notifications = [
+        notification_row(
+            user_id, 'achievement_earned',
+            'Achievement Unlocked',
+            f'You earned "{a["name"]}" - {a["description"]}',
+            url_for('achievements_page')
+        )
+        for a in earned if a['id'] in inserted_ids
+    ]
+    if notifications:
+        db.session.bulk_insert_mappings(Notification, notifications)
     db.session.commit()
 
 
+_PENDING_ACHIEVEMENT_CHECKS = set()
+_PENDING_ACHIEVEMENT_LOCK = threading.Lock()
+
+
+def queue_achievement_check(user_id):
+    """Run check_achievements in the background, skipping it if one is already queued for the user."""
+    with _PENDING_ACHIEVEMENT_LOCK:
+        if user_id in _PENDING_ACHIEVEMENT_CHECKS:
+            return
+        _PENDING_ACHIEVEMENT_CHECKS.add(user_id)
+    run_in_background(_run_achievement_check, user_id)
+
+
+def _run_achievement_check(user_id):
+    # Clear the marker before reading stats so later writes queue a fresh check
+    with _PENDING_ACHIEVEMENT_LOCK:
+        _PENDING_ACHIEVEMENT_CHECKS.discard(user_id)
+    check_achievements(user_id)
+
+
 def check_completed_challenges(user_id):
     """Check and finalize any challenges that have ended."""
     today = get_user_today()
 
     # Get user's active challenges that have passed their end date
-    memberships = ChallengeMember.query.filter_by(user_id=user_id).all()
+    memberships = ChallengeMember.query.join(ChallengeMember.challenge).filter(
+        ChallengeMember.user_id == user_id,
+        Challenge.is_completed == False,
+        Challenge.end_date.isnot(None),
+        Challenge.end_date < today
+    ).options(
+        contains_eager(ChallengeMember.challenge)
+        .selectinload(Challenge.members)
+        .joinedload(ChallengeMember.user)
+    ).all()
+
+    if not memberships:
+        return
 
+    notifications = []
     for membership in memberships:
         challenge = membership.challenge
-        if challenge.end_date and challenge.end_date < today and not challenge.is_completed:
-            # Find winner (highest points)
-            winner_member = ChallengeMember.query.filter_by(
-                challenge_id=challenge.id
-            ).order_by(ChallengeMember.points.desc()).first()
-
-            challenge.is_completed = True
-            challenge.winner_id = winner_member.user_id if winner_member else None
-
-            # Notify all members
-            winner_name = winner_member.user.display_name if winner_member else 'No one'
-            winner_points = winner_member.points if winner_member else 0
-
-            for member in challenge.members:
-                create_notification(
-                    member.user_id, 'challenge_completed',
-                    'Challenge Ended',
-                    f'"{challenge.name}" has ended. {winner_name} won with {winner_points} points.',
-                    url_for('view_challenge', challenge_id=challenge.id),
-                    commit=False
-                )
 
+        # Find winner (highest points) among the already-loaded members
+        winner_member = max(challenge.members, key=lambda m: m.points or 0, default=None)
+
+        challenge.is_completed = True
+        challenge.winner_id = winner_member.user_id if winner_member else None
+
+        # Notify all members
+        winner_name = winner_member.user.display_name if winner_member else 'No one'
+        winner_points = winner_member.points if winner_member else 0
+
+        for member in challenge.members:
+            notifications.append(notification_row(
+                member.user_id, 'challenge_completed',
+                'Challenge Ended',
+                f'"{challenge.name}" has ended. {winner_name} won with {winner_points} points.',
+                url_for('view_challenge', challenge_id=challenge.id)
+            ))
+
+    if notifications:
+        db.session.bulk_insert_mappings(Notification, notifications)
     db.session.commit()
 
 
@@ -539,24 +779,30 @@ def login_required(f):
 
 # --- Routes ---
 
+SW_STATIC_FILES = ['style.css', 'script.js', 'perf-metrics.js', 'challenge.js', 'create-challenge.js']
+SW_CACHE_TTL = 60  # seconds
+_SW_CACHE = {'ts': 0, 'body': None}
+
+
 @app.route('/sw.js')
 def service_worker():
     """Serve service worker from root scope with dynamic cache version."""
-    import hashlib
-    static_files = ['style.css', 'script.js', 'perf-metrics.js', 'challenge.js', 'create-challenge.js']
-    mtimes = ''
-    for f in static_files:
-        fpath = os.path.join(app.static_folder, f)
-        if os.path.exists(fpath):
-            mtimes += str(os.path.getmtime(fpath))
-    version = 'sc-' + hashlib.md5(mtimes.encode()).hexdigest()[:8]
-
-    sw_path = os.path.join(app.static_folder, 'sw.js')
-    with open(sw_path, 'r') as f:
-        content = f.read()
-    content = content.replace('__SW_VERSION__', version)
-
-    response = app.make_response(content)
+    now = time.monotonic()
+    if _SW_CACHE['body'] is None or now - _SW_CACHE['ts'] >= SW_CACHE_TTL:
+        mtimes = ''
+        for f in SW_STATIC_FILES:
+            fpath = os.path.join(app.static_folder, f)
+            if os.path.exists(fpath):
+                mtimes += str(os.path.getmtime(fpath))
+        version = 'sc-' + hashlib.blake2b(mtimes.encode(), digest_size=4).hexdigest()
+
+        sw_path = os.path.join(app.static_folder, 'sw.js')
+        with open(sw_path, 'r') as f:
+            content = f.read()
+        _SW_CACHE['body'] = content.replace('__SW_VERSION__', version)
+        _SW_CACHE['ts'] = now
+
+    response = app.make_response(_SW_CACHE['body'])
     response.headers['Content-Type'] = 'application/javascript'
     response.headers['Cache-Control'] = 'no-cache'
     return response
@@ -592,7 +838,7 @@ def register():
             flash('Username must be at least 3 characters.', 'error')
             return redirect(url_for('register'))
 
-        if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email):
+        if not EMAIL_RE.match(email):
             flash('Please enter a valid email address.', 'error')
             return redirect(url_for('register'))
 
@@ -600,17 +846,17 @@ def register():
             flash('Password must be at least 6 characters.', 'error')
             return redirect(url_for('register'))
 
-        if User.query.filter_by(username=username).first():
+        if row_exists(User.query.filter_by(username=username)):
             flash('Username already taken.', 'error')
             return redirect(url_for('register'))
 
-        if User.query.filter_by(email=email).first():
+        if row_exists(User.query.filter_by(email=email)):
             flash('An account with this email already exists.', 'error')
             return redirect(url_for('register'))
 
         user = User(
             username=username,
-            password_hash=generate_password_hash(password),
+            password_hash=generate_password_hash(password, method=PASSWORD_HASH_METHOD),
             display_name=display_name or username,
             email=email,
             timezone=user_timezone
@@ -706,8 +952,15 @@ def auth_google_callback():
         flash('Could not retrieve your Google account information.', 'error')
         return redirect(url_for('login'))
 
+    # Fetch every user that could match this Google account in one query
+    email_username = email.split('@')[0].lower() if email else None
+    match_filters = [User.google_id == google_id]
+    if email:
+        match_filters += [User.email == email, User.username == email_username]
+    candidates = User.query.filter(db.or_(*match_filters)).all()
+
     # Case 1: Returning Google user
-    user = User.query.filter_by(google_id=google_id).first()
+    user = next((u for u in candidates if u.google_id == google_id), None)
     if user:
         session['user_id'] = user.id
         session['username'] = user.username
@@ -719,9 +972,10 @@ def auth_google_callback():
 
     # Case 2: Account linking - email matches existing user
     if email:
-        existing_user = User.query.filter(
-            (User.email == email) | (User.username == email.split('@')[0].lower())
-        ).first()
+        existing_user = (
+            next((u for u in candidates if u.email == email), None)
+            or next((u for u in candidates if u.username == email_username), None)
+        )
         if existing_user and not existing_user.google_id:
             existing_user.google_id = google_id
             existing_user.email = existing_user.email or email
@@ -736,13 +990,17 @@ def auth_google_callback():
             return redirect(url_for('dashboard'))
 
     # Case 3: Brand new user
-    base_username = email.split('@')[0].lower() if email else 'user'
-    base_username = re.sub(r'[^a-z0-9_]', '', base_username)
+    base_username = email_username or 'user'
+    base_username = USERNAME_SANITIZE_RE.sub('', base_username)
     if len(base_username) < 3:
         base_username = 'user'
 
+    # Load all usernames sharing the prefix once, then pick a free suffix locally
+    taken_usernames = {row.username for row in User.query.with_entities(User.username).filter(
+        User.username.like(f'{base_username}%')
+    ).all()}
     username = base_username
-    while User.query.filter_by(username=username).first():
+    while username in taken_usernames:
         suffix = ''.join(random.choices(string.digits, k=4))
         username = f"{base_username}_{suffix}"
 
@@ -771,31 +1029,32 @@ def dashboard():
     user_id = session['user_id']
     today = get_user_today()
 
-    if session.pop('needs_achievement_refresh', False):
-        check_achievements(user_id)
-
     check_completed_challenges(user_id)
 
-    # Get active challenges
-    memberships = ChallengeMember.query.filter_by(user_id=user_id).join(Challenge).filter(
-        Challenge.is_completed == False
-    ).options(
-        joinedload(ChallengeMember.challenge).joinedload(Challenge.creator)
+    # Load active and completed memberships in one round-trip
+    all_memberships = ChallengeMember.query.filter_by(user_id=user_id).options(
+        joinedload(ChallengeMember.challenge).joinedload(Challenge.creator),
+        joinedload(ChallengeMember.challenge).joinedload(Challenge.winner)
     ).all()
 
+    memberships = [m for m in all_memberships if not m.challenge.is_completed]
+    completed_memberships = [m for m in all_memberships if m.challenge.is_completed]
+
+    all_challenge_ids = [m.challenge_id for m in all_memberships]
     active_challenge_ids = [m.challenge_id for m in memberships]
     member_counts = {}
     checked_in_today_ids = set()
 
-    if active_challenge_ids:
+    if all_challenge_ids:
         member_counts_rows = db.session.query(
             ChallengeMember.challenge_id,
             db.func.count(ChallengeMember.id)
         ).filter(
-            ChallengeMember.challenge_id.in_(active_challenge_ids)
+            ChallengeMember.challenge_id.in_(all_challenge_ids)
         ).group_by(ChallengeMember.challenge_id).all()
         member_counts = {cid: cnt for cid, cnt in member_counts_rows}
 
+    if active_challenge_ids:
         checked_rows = Checkin.query.with_entities(Checkin.challenge_id).filter(
             Checkin.user_id == user_id,
             Checkin.checkin_date == today,
@@ -825,25 +1084,6 @@ def dashboard():
             'checked_in_today': checked_in_today,
         })
 
-    # Get completed challenges
-    completed_memberships = ChallengeMember.query.filter_by(user_id=user_id).join(Challenge).filter(
-        Challenge.is_completed == True
-    ).options(
-        joinedload(ChallengeMember.challenge).joinedload(Challenge.creator),
-        joinedload(ChallengeMember.challenge).joinedload(Challenge.winner)
-    ).all()
-
-    completed_challenge_ids = [m.challenge_id for m in completed_memberships]
-    completed_member_counts = {}
-    if completed_challenge_ids:
-        completed_member_counts_rows = db.session.query(
-            ChallengeMember.challenge_id,
-            db.func.count(ChallengeMember.id)
-        ).filter(
-            ChallengeMember.challenge_id.in_(completed_challenge_ids)
-        ).group_by(ChallengeMember.challenge_id).all()
-        completed_member_counts = {cid: cnt for cid, cnt in completed_member_counts_rows}
-
     completed_challenges = []
     for m in completed_memberships:
         c = m.challenge
@@ -853,16 +1093,16 @@ def dashboard():
             'end_date': c.end_date,
             'creator_name': c.creator.display_name,
             'winner_name': c.winner.display_name if c.winner else None,
-            'member_count': completed_member_counts.get(c.id, 0),
+            'member_count': member_counts.get(c.id, 0),
             'points': m.points,
             'current_streak': m.current_streak,
             'best_streak': m.best_streak,
         })
 
-    # Calculate stats
-    total_points = db.session.query(db.func.sum(ChallengeMember.points)).filter_by(user_id=user_id).scalar() or 0
-    best_current_streak = db.session.query(db.func.max(ChallengeMember.current_streak)).filter_by(user_id=user_id).scalar() or 0
-    all_time_best_streak = db.session.query(db.func.max(ChallengeMember.best_streak)).filter_by(user_id=user_id).scalar() or 0
+    # Calculate stats from the memberships already in memory
+    total_points = sum(m.points or 0 for m in all_memberships)
+    best_current_streak = max((m.current_streak or 0 for m in all_memberships), default=0)
+    all_time_best_streak = max((m.best_streak or 0 for m in all_memberships), default=0)
     active_challenges = len(challenges)
     total_checkins = Checkin.query.filter_by(user_id=user_id).count()
     total_challenges = active_challenges + len(completed_challenges)
@@ -940,10 +1180,14 @@ def create_challenge():
                 flash('Invalid date format.', 'error')
                 return redirect(url_for('create_challenge'))
 
-        # Generate unique join code
-        join_code = generate_join_code()
-        while Challenge.query.filter_by(join_code=join_code).first():
-            join_code = generate_join_code()
+        # Generate unique join code: probe a batch of candidates in one query
+        join_code = None
+        while join_code is None:
+            candidates = {generate_join_code() for _ in range(JOIN_CODE_BATCH)}
+            taken = {row.join_code for row in Challenge.query.with_entities(Challenge.join_code).filter(
+                Challenge.join_code.in_(candidates)
+            ).all()}
+            join_code = next((c for c in candidates if c not in taken), None)
 
         challenge = Challenge(
             name=name,
@@ -968,7 +1212,10 @@ def create_challenge():
         db.session.add(membership)
         db.session.commit()
 
-        check_achievements(session['user_id'])
+        if is_public:
+            _EXPLORE_CACHE['rows'] = None
+
+        queue_achievement_check(session['user_id'])
 
         flash(f'Challenge created. Share code: {join_code}', 'success')
         return redirect(url_for('view_challenge', challenge_id=challenge.id))
@@ -996,9 +1243,9 @@ def join_challenge():
             flash('This challenge has already ended.', 'error')
             return redirect(url_for('join_challenge'))
 
-        if ChallengeMember.query.filter_by(
+        if row_exists(ChallengeMember.query.filter_by(
             challenge_id=challenge.id, user_id=session['user_id']
-        ).first():
+        )):
             flash('You are already in this challenge.', 'error')
             return redirect(url_for('view_challenge', challenge_id=challenge.id))
 
@@ -1017,7 +1264,7 @@ def join_challenge():
                 url_for('view_challenge', challenge_id=challenge.id)
             )
 
-        check_achievements(session['user_id'])
+        queue_achievement_check(session['user_id'])
 
         flash(f'Joined "{challenge.name}" successfully.', 'success')
         return redirect(url_for('view_challenge', challenge_id=challenge.id))
@@ -1028,9 +1275,9 @@ def join_challenge():
         challenge = Challenge.query.filter_by(join_code=prefill_code).first()
         if challenge:
             # Already a member — go straight to challenge
-            if ChallengeMember.query.filter_by(
+            if row_exists(ChallengeMember.query.filter_by(
                 challenge_id=challenge.id, user_id=session['user_id']
-            ).first():
+            )):
                 return redirect(url_for('view_challenge', challenge_id=challenge.id))
 
             # Auto-join if challenge is still active
@@ -1050,13 +1297,16 @@ def join_challenge():
                         url_for('view_challenge', challenge_id=challenge.id)
                     )
 
-                check_achievements(session['user_id'])
+                queue_achievement_check(session['user_id'])
                 flash(f'Joined "{challenge.name}" successfully.', 'success')
                 return redirect(url_for('view_challenge', challenge_id=challenge.id))
 
     return render_template('join_challenge.html', prefill_code=prefill_code)
 
 
+FEED_PHOTO_WIDTH = 320  # matches .feed-photo max-width
+
+
 @app.route('/challenge/<int:challenge_id>')
 @login_required
 def view_challenge(challenge_id):
@@ -1064,28 +1314,28 @@ def view_challenge(challenge_id):
     today = get_user_today()
 
     challenge = Challenge.query.options(
-        joinedload(Challenge.creator),
-        selectinload(Challenge.members).joinedload(ChallengeMember.user)
+        joinedload(Challenge.creator)
     ).get_or_404(challenge_id)
+    members = ranked_members(challenge_id)
 
-    membership = ChallengeMember.query.filter_by(
-        challenge_id=challenge_id, user_id=user_id
-    ).first()
+    # Members (and their users) are already loaded, so find ours in memory
+    membership = next((m for m in members if m.user_id == user_id), None)
 
     if not membership:
         # Redirect non-members to join page with code pre-filled
         flash(f'Join "{challenge.name}" to view this challenge.', 'info')
         return redirect(url_for('join_challenge', code=challenge.join_code))
 
-    checked_today_rows = Checkin.query.with_entities(Checkin.user_id).filter(
+    checked_today_rows = Checkin.query.with_entities(Checkin.user_id, Checkin.created_at).filter(
         Checkin.challenge_id == challenge_id,
         Checkin.checkin_date == today
     ).all()
-    checked_today_user_ids = {row.user_id for row in checked_today_rows}
+    checked_today_times = {row.user_id: row.created_at for row in checked_today_rows}
+    checked_today_user_ids = checked_today_times.keys()
 
-    # Build leaderboard
+    # Build leaderboard (members arrive ranked)
     leaderboard = []
-    for m in challenge.members:
+    for m in members:
         checked_in_today = m.user_id in checked_today_user_ids
 
         leaderboard.append({
@@ -1099,16 +1349,14 @@ def view_challenge(challenge_id):
             'checked_in_today': checked_in_today,
         })
 
-    leaderboard.sort(key=lambda x: (-x['points'], -x['current_streak']))
-
     checked_in_today = user_id in checked_today_user_ids
 
     # Recent checkins with reactions
     recent_checkins = Checkin.query.filter_by(
         challenge_id=challenge_id
     ).options(
-        joinedload(Checkin.user),
-        selectinload(Checkin.reactions)
+        load_only(Checkin.id, Checkin.created_at, Checkin.note, Checkin.photo_url),
+        joinedload(Checkin.user).load_only(User.display_name, User.profile_photo)
     ).order_by(Checkin.created_at.desc()).limit(20).all()
 
     recent_checkins_data = [{
@@ -1118,26 +1366,42 @@ def view_challenge(challenge_id):
         'created_at': c.created_at,
         'note': c.note,
         'photo_url': c.photo_url,
+        'photo_thumb': get_optimized_url(c.photo_url, width=FEED_PHOTO_WIDTH, crop='limit'),
+        'photo_thumb_2x': get_optimized_url(c.photo_url, width=FEED_PHOTO_WIDTH, crop='limit', dpr=2.0),
     } for c in recent_checkins]
 
-    reactions_map = {}
-    for c in recent_checkins:
-        reactions = {}
-        for r in c.reactions:
-            if r.reaction not in reactions:
-                reactions[r.reaction] = {'count': 0, 'user_reacted': False}
-            reactions[r.reaction]['count'] += 1
-            if r.user_id == user_id:
-                reactions[r.reaction]['user_reacted'] = True
-        reactions_map[c.id] = [
+    # Aggregate reactions for all recent check-ins from one column-only query
+    recent_ids = [c.id for c in recent_checkins]
+    reaction_rows = []
+    if recent_ids:
+        reaction_rows = CheckinReaction.query.with_entities(
+            CheckinReaction.checkin_id, CheckinReaction.reaction, CheckinReaction.user_id
+        ).filter(
+            CheckinReaction.checkin_id.in_(recent_ids)
+        ).order_by(CheckinReaction.id).all()
+
+    reactions_by_checkin = {cid: {} for cid in recent_ids}
+    for row in reaction_rows:
+        reactions = reactions_by_checkin[row.checkin_id]
+        if row.reaction not in reactions:
+            reactions[row.reaction] = {'count': 0, 'user_reacted': False}
+        reactions[row.reaction]['count'] += 1
+        if row.user_id == user_id:
+            reactions[row.reaction]['user_reacted'] = True
+
+    reactions_map = {
+        cid: [
             {'reaction': k, 'count': v['count'], 'user_reacted': v['user_reacted']}
             for k, v in reactions.items()
         ]
+        for cid, reactions in reactions_by_checkin.items()
+    }
 
     comments = ChallengeComment.query.filter_by(
         challenge_id=challenge_id
     ).options(
-        joinedload(ChallengeComment.user)
+        load_only(ChallengeComment.id, ChallengeComment.created_at, ChallengeComment.message),
+        joinedload(ChallengeComment.user).load_only(User.display_name, User.profile_photo)
     ).order_by(ChallengeComment.created_at.desc()).limit(30).all()
 
     comments_data = [{
@@ -1167,9 +1431,9 @@ def view_challenge(challenge_id):
 
     # Check-in preview
     yesterday = today - timedelta(days=1)
-    checked_yesterday = Checkin.query.filter_by(
+    checked_yesterday = row_exists(Checkin.query.filter_by(
         challenge_id=challenge_id, user_id=user_id, checkin_date=yesterday
-    ).first() is not None
+    ))
 
     current_streak = membership.current_streak
     has_freeze = membership.streak_freezes > 0
@@ -1196,13 +1460,7 @@ def view_challenge(challenge_id):
     checkin_preview['days_to_next_freeze'] = days_to_next_freeze
 
     # Checkin time if already checked in
-    checkin_time = None
-    if checked_in_today:
-        checkin_row = Checkin.query.filter_by(
-            challenge_id=challenge_id, user_id=user_id, checkin_date=today
-        ).first()
-        if checkin_row:
-            checkin_time = checkin_row.created_at
+    checkin_time = checked_today_times.get(user_id)
 
     return render_template('challenge.html',
                          challenge=challenge,
@@ -1232,9 +1490,9 @@ def checkin(challenge_id):
     client_date = request.form.get('client_date', '').strip()
     user_today = get_user_today(user_tz)
 
-    if client_date and re.match(r'^\d{4}-\d{2}-\d{2}$', client_date):
+    if client_date and DATE_RE.match(client_date):
         try:
-            parsed = datetime.strptime(client_date, '%Y-%m-%d').date()
+            parsed = date.fromisoformat(client_date)
             if abs((user_today - parsed).days) <= 1:
                 today = parsed
             else:
@@ -1247,9 +1505,8 @@ def checkin(challenge_id):
     yesterday = today - timedelta(days=1)
     note = request.form.get('note', '').strip()
 
-    membership = ChallengeMember.query.filter_by(
-        challenge_id=challenge_id, user_id=user_id
-    ).first()
+    # Membership and challenge in one query
+    membership = get_challenge_membership(challenge_id, user_id)
 
     is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
@@ -1259,23 +1516,30 @@ def checkin(challenge_id):
         flash('You are not a member of this challenge.', 'error')
         return redirect(url_for('dashboard'))
 
-    challenge = Challenge.query.get(challenge_id)
+    challenge = membership.challenge
     if challenge.is_completed:
         if is_ajax:
             return jsonify({'error': 'This challenge has already ended.'}), 400
         flash('This challenge has already ended.', 'error')
         return redirect(url_for('view_challenge', challenge_id=challenge_id))
 
-    if Checkin.query.filter_by(
-        challenge_id=challenge_id, user_id=user_id, checkin_date=today
-    ).first():
+    # Today's and yesterday's check-ins in one query
+    recent_dates = {row.checkin_date for row in Checkin.query.with_entities(Checkin.checkin_date).filter(
+        Checkin.challenge_id == challenge_id,
+        Checkin.user_id == user_id,
+        Checkin.checkin_date.in_([today, yesterday])
+    ).all()}
+
+    if today in recent_dates:
         if is_ajax:
             return jsonify({'error': 'Already checked in today.'}), 400
         flash('Already checked in today.', 'error')
         return redirect(url_for('view_challenge', challenge_id=challenge_id))
 
-    # Handle photo upload to Cloudinary
+    # Photo proof is uploaded before the check-in counts; optional photos
+    # are validated now and uploaded after the response
     photo_url = None
+    pending_photo = None
     verification_type = challenge.verification_type or 'none'
 
     if 'photo' in request.files:
@@ -1288,9 +1552,12 @@ def checkin(challenge_id):
                 return redirect(url_for('view_challenge', challenge_id=challenge_id))
 
             if cloudinary_configured:
-                photo_url = upload_checkin_photo(photo, challenge_id, user_id, today.isoformat())
-                if not photo_url:
-                    logger.warning(f'Failed to upload checkin photo for user {user_id}')
+                if verification_type == 'photo_required':
+                    photo_url = upload_checkin_photo(photo, challenge_id, user_id, today.isoformat())
+                    if not photo_url:
+                        logger.warning(f'Failed to upload checkin photo for user {user_id}')
+                else:
+                    pending_photo = buffer_upload(photo)
 
     if verification_type == 'photo_required' and not photo_url:
         if is_ajax:
@@ -1299,9 +1566,7 @@ def checkin(challenge_id):
         return redirect(url_for('view_challenge', challenge_id=challenge_id))
 
     # Streak calculation with freeze support
-    checked_yesterday = Checkin.query.filter_by(
-        challenge_id=challenge_id, user_id=user_id, checkin_date=yesterday
-    ).first() is not None
+    checked_yesterday = yesterday in recent_dates
 
     freeze_used = False
     if checked_yesterday:
@@ -1334,25 +1599,51 @@ def checkin(challenge_id):
         photo_url=photo_url
     )
     db.session.add(checkin_obj)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # A concurrent request recorded today's check-in first
+        db.session.rollback()
+        if pending_photo:
+            pending_photo.close()
+        if is_ajax:
+            return jsonify({'error': 'Already checked in today.'}), 400
+        flash('Already checked in today.', 'error')
+        return redirect(url_for('view_challenge', challenge_id=challenge_id))
 
-    # Update membership
-    membership.points += points_earned
-    membership.current_streak = new_streak
-    membership.best_streak = max(membership.best_streak, new_streak)
-    membership.streak_freezes = max(0, membership.streak_freezes + freeze_earned - (1 if freeze_used else 0))
-    if freeze_used:
-        membership.freezes_used += 1
-
-    # Update user total points
-    user = User.query.get(user_id)
-    user.total_points += points_earned
+    # Update membership and user totals with atomic UPDATEs (no read-modify-write)
+    freeze_delta = freeze_earned - (1 if freeze_used else 0)
+    db.session.execute(
+        db.update(ChallengeMember).where(ChallengeMember.id == membership.id).values(
+            points=ChallengeMember.points + points_earned,
+            current_streak=new_streak,
+            best_streak=db.case(
+                (ChallengeMember.best_streak < new_streak, new_streak),
+                else_=ChallengeMember.best_streak
+            ),
+            streak_freezes=db.case(
+                (ChallengeMember.streak_freezes + freeze_delta < 0, 0),
+                else_=ChallengeMember.streak_freezes + freeze_delta
+            ),
+            freezes_used=ChallengeMember.freezes_used + (1 if freeze_used else 0),
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        db.update(User).where(User.id == user_id).values(
+            total_points=User.total_points + points_earned
+        ).execution_options(synchronize_session=False)
+    )
 
+    checkin_id = checkin_obj.id
     db.session.commit()
 
-    if is_ajax:
-        session['needs_achievement_refresh'] = True
-    else:
-        check_achievements(user_id)
+    # Judge the check-in now; a deferred photo queues another check once stored
+    queue_achievement_check(user_id)
+    if pending_photo:
+        run_in_background(
+            attach_checkin_photo, checkin_id, pending_photo,
+            challenge_id, user_id, today.isoformat()
+        )
 
     # Build response message
     msg_parts = [f'+{points_earned} points (Streak: {new_streak})']
@@ -1396,27 +1687,32 @@ def react_to_checkin(challenge_id):
     if not checkin_id or reaction not in allowed_reactions:
         return jsonify({'error': 'Invalid reaction'}), 400
 
-    existing = CheckinReaction.query.filter_by(
+    # Toggle: delete by the unique key, and insert only if nothing was removed
+    removed = CheckinReaction.query.filter_by(
         checkin_id=checkin_id, user_id=user_id, reaction=reaction
-    ).first()
+    ).delete(synchronize_session=False)
 
-    if existing:
-        db.session.delete(existing)
-    else:
+    if not removed:
         new_reaction = CheckinReaction(
             checkin_id=checkin_id,
             user_id=user_id,
             reaction=reaction
         )
         db.session.add(new_reaction)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Unknown check-in, or a concurrent duplicate of this reaction
+            db.session.rollback()
+            return jsonify({'error': 'Invalid reaction'}), 400
 
-    db.session.commit()
-
+    # Count inside the same transaction, before committing
     count = CheckinReaction.query.filter_by(
         checkin_id=checkin_id, reaction=reaction
     ).count()
+    db.session.commit()
 
-    return jsonify({'count': count, 'toggled': existing is None})
+    return jsonify({'count': count, 'toggled': not removed})
 
 
 @app.route('/challenge/<int:challenge_id>/comment', methods=['POST'])
@@ -1434,9 +1730,7 @@ def add_comment(challenge_id):
         flash('Comment is too long (500 character limit).', 'error')
         return redirect(url_for('view_challenge', challenge_id=challenge_id))
 
-    if not ChallengeMember.query.filter_by(
-        challenge_id=challenge_id, user_id=user_id
-    ).first():
+    if not get_challenge_membership(challenge_id, user_id):
         flash('You are not a member of this challenge.', 'error')
         return redirect(url_for('dashboard'))
 
@@ -1462,31 +1756,26 @@ def nudge_user(challenge_id, target_user_id):
     if target_user_id == user_id:
         return jsonify({'error': "Can't nudge yourself"}), 400
 
-    sender_member = ChallengeMember.query.filter_by(
-        challenge_id=challenge_id, user_id=user_id
-    ).first()
-    target_member = ChallengeMember.query.filter_by(
-        challenge_id=challenge_id, user_id=target_user_id
-    ).first()
+    # Both memberships (with the challenge and the target's email) in one query
+    members = {m.user_id: m for m in ChallengeMember.query.options(
+        joinedload(ChallengeMember.challenge),
+        joinedload(ChallengeMember.user).load_only(User.email)
+    ).filter(
+        ChallengeMember.challenge_id == challenge_id,
+        ChallengeMember.user_id.in_([user_id, target_user_id])
+    )}
+    sender_member = members.get(user_id)
+    target_member = members.get(target_user_id)
 
     if not sender_member or not target_member:
         return jsonify({'error': 'Invalid member'}), 400
 
-    already_checked = Checkin.query.filter_by(
+    if row_exists(Checkin.query.filter_by(
         challenge_id=challenge_id, user_id=target_user_id, checkin_date=today
-    ).first()
-    if already_checked:
+    )):
         return jsonify({'error': 'Already checked in'}), 400
 
-    existing_nudge = Nudge.query.filter_by(
-        challenge_id=challenge_id,
-        from_user_id=user_id,
-        to_user_id=target_user_id,
-        nudge_date=today
-    ).first()
-    if existing_nudge:
-        return jsonify({'error': 'Already nudged today'}), 400
-
+    # uq_nudge_daily rejects a second nudge for the same day
     nudge = Nudge(
         challenge_id=challenge_id,
         from_user_id=user_id,
@@ -1494,8 +1783,13 @@ def nudge_user(challenge_id, target_user_id):
         nudge_date=today
     )
     db.session.add(nudge)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Already nudged today'}), 400
 
-    challenge = Challenge.query.get(challenge_id)
+    challenge = sender_member.challenge
     sender_name = session.get('display_name', 'Someone')
 
     create_notification(
@@ -1508,7 +1802,7 @@ def nudge_user(challenge_id, target_user_id):
     )
 
     # Email nudge (placeholder until SendGrid/SMTP is configured)
-    target_user = User.query.get(target_user_id)
+    target_user = target_member.user
     if target_user and target_user.email:
         logger.info(f'EMAIL TRIGGER: Nudge email to {target_user.email} - '
                      f'{sender_name} nudged them for "{challenge.name}"')
@@ -1519,23 +1813,56 @@ def nudge_user(challenge_id, target_user_id):
     return jsonify({'success': True, 'message': 'Nudge sent!'})
 
 
+EXPLORE_CACHE_TTL = 60  # seconds
+EXPLORE_CANDIDATES = 60
+_EXPLORE_CACHE = {'ts': 0, 'rows': None}
+
+
+def _recent_public_challenges():
+    """Newest open public challenges as plain dicts, cached for EXPLORE_CACHE_TTL."""
+    now = time.monotonic()
+    if _EXPLORE_CACHE['rows'] is None or now - _EXPLORE_CACHE['ts'] >= EXPLORE_CACHE_TTL:
+        recent = db.session.query(
+            Challenge.id, Challenge.name, Challenge.description,
+            Challenge.join_code, Challenge.points_per_checkin,
+            User.display_name.label('creator_name')
+        ).join(User, Challenge.creator_id == User.id).filter(
+            Challenge.is_public == True,
+            Challenge.is_completed == False
+        ).order_by(Challenge.created_at.desc()).limit(EXPLORE_CANDIDATES).all()
+        _EXPLORE_CACHE['rows'] = [row._asdict() for row in recent]
+        _EXPLORE_CACHE['ts'] = now
+    return _EXPLORE_CACHE['rows']
+
+
 @app.route('/explore')
 @login_required
 def explore():
     user_id = session['user_id']
 
     # Get user's current challenge IDs
-    user_challenge_ids = [m.challenge_id for m in ChallengeMember.query.filter_by(user_id=user_id).all()]
+    user_challenge_ids = {
+        cid for (cid,) in db.session.query(ChallengeMember.challenge_id).filter_by(user_id=user_id)
+    }
 
-    # Get public challenges the user hasn't joined
-    query = Challenge.query.filter(
-        Challenge.is_public == True,
-        Challenge.is_completed == False
-    )
-    if user_challenge_ids:
-        query = query.filter(~Challenge.id.in_(user_challenge_ids))
+    # Public challenges the user hasn't joined, from the shared cached list
+    public_challenges = [
+        c for c in _recent_public_challenges() if c['id'] not in user_challenge_ids
+    ][:20]
 
-    challenges = query.order_by(Challenge.created_at.desc()).limit(20).all()
+    member_counts = {}
+    if public_challenges:
+        member_counts_rows = db.session.query(
+            ChallengeMember.challenge_id,
+            db.func.count(ChallengeMember.id)
+        ).filter(
+            ChallengeMember.challenge_id.in_([c['id'] for c in public_challenges])
+        ).group_by(ChallengeMember.challenge_id).all()
+        member_counts = {cid: cnt for cid, cnt in member_counts_rows}
+
+    challenges = [
+        dict(c, member_count=member_counts.get(c['id'], 0)) for c in public_challenges
+    ]
 
     return render_template('explore.html', challenges=challenges)
 
@@ -1547,9 +1874,14 @@ def profile():
     user = User.query.get(user_id)
 
     # Calculate stats
-    total_challenges = ChallengeMember.query.filter_by(user_id=user_id).count()
-    total_points = db.session.query(db.func.sum(ChallengeMember.points)).filter_by(user_id=user_id).scalar() or 0
-    best_streak = db.session.query(db.func.max(ChallengeMember.best_streak)).filter_by(user_id=user_id).scalar() or 0
+    total_challenges, total_points, best_streak = db.session.query(
+        db.func.count(ChallengeMember.id),
+        db.func.coalesce(db.func.sum(ChallengeMember.points), 0),
+        db.func.coalesce(db.func.max(ChallengeMember.best_streak), 0),
+    ).filter(ChallengeMember.user_id == user_id).one()
+
+    today = get_user_today()
+
     total_checkins = Checkin.query.filter_by(user_id=user_id).count()
 
     stats = {
@@ -1560,7 +1892,6 @@ def profile():
     }
 
     # 30-day calendar
-    today = get_user_today()
     thirty_days_ago = today - timedelta(days=30)
 
     checkin_history = db.session.query(
@@ -1584,20 +1915,11 @@ def profile():
             'is_today': day == today
         })
 
-    # Weekly digest
+    # Weekly digest, bucketed from the calendar rows above
     week_ago = today - timedelta(days=7)
     two_weeks_ago = today - timedelta(days=14)
-
-    this_week_checkins = Checkin.query.filter(
-        Checkin.user_id == user_id,
-        Checkin.checkin_date > week_ago
-    ).count()
-
-    last_week_checkins = Checkin.query.filter(
-        Checkin.user_id == user_id,
-        Checkin.checkin_date > two_weeks_ago,
-        Checkin.checkin_date <= week_ago
-    ).count()
+    this_week_checkins = sum(c for d, c in checkin_dates.items() if d > week_ago)
+    last_week_checkins = sum(c for d, c in checkin_dates.items() if two_weeks_ago < d <= week_ago)
 
     weekly_digest = {
         'checkins': this_week_checkins,
@@ -1632,7 +1954,6 @@ def profile():
 @login_required
 def edit_profile():
     user_id = session['user_id']
-    user = User.query.get(user_id)
 
     display_name = request.form.get('display_name', '').strip()
     user_timezone = validate_timezone(request.form.get('timezone', ''))
@@ -1645,8 +1966,10 @@ def edit_profile():
         flash('Display name is too long (50 character limit).', 'error')
         return redirect(url_for('profile'))
 
-    user.display_name = display_name
-    user.timezone = user_timezone
+    User.query.filter_by(id=user_id).update(
+        {'display_name': display_name, 'timezone': user_timezone},
+        synchronize_session=False
+    )
     db.session.commit()
 
     session['display_name'] = display_name
@@ -1688,8 +2011,9 @@ def upload_profile_photo_route():
         flash('Failed to upload photo. Please try again.', 'error')
         return redirect(url_for('profile'))
 
-    user = User.query.get(user_id)
-    user.profile_photo = photo_url
+    User.query.filter_by(id=user_id).update(
+        {'profile_photo': photo_url}, synchronize_session=False
+    )
     db.session.commit()
 
     session['profile_photo'] = photo_url
@@ -1702,12 +2026,13 @@ def upload_profile_photo_route():
 @login_required
 def remove_profile_photo():
     user_id = session['user_id']
-    user = User.query.get(user_id)
 
     # Note: We don't delete from Cloudinary to avoid complexity
     # Cloudinary's free tier has generous limits
 
-    user.profile_photo = None
+    User.query.filter_by(id=user_id).update(
+        {'profile_photo': None}, synchronize_session=False
+    )
     db.session.commit()
 
     session.pop('profile_photo', None)
@@ -1760,9 +2085,18 @@ def notifications_page():
         Notification.created_at.desc()
     ).limit(50).all()
 
-    # Mark all as read
-    Notification.query.filter_by(user_id=user_id, is_read=False).update({'is_read': True})
-    db.session.commit()
+    # Mark all as read, skipping the UPDATE when nothing fetched is unread.
+    # The fetched rows are detached first so they render as loaded instead of
+    # being refreshed one by one after the commit.
+    if any(not n.is_read for n in notifications):
+        for n in notifications:
+            db.session.expunge(n)
+        Notification.query.filter(
+            Notification.user_id == user_id, Notification.is_read == db.false()
+        ).update(
+            {'is_read': True}, synchronize_session=False
+        )
+        db.session.commit()
 
     return render_template('notifications.html', notifications=notifications)
 
@@ -1772,9 +2106,9 @@ def notifications_page():
 def api_leaderboard(challenge_id):
     today = get_user_today()
 
-    challenge = Challenge.query.options(
-        selectinload(Challenge.members).joinedload(ChallengeMember.user)
-    ).get_or_404(challenge_id)
+    members = ranked_members(challenge_id)
+    if not members:
+        abort(404)
 
     checked_today_rows = Checkin.query.with_entities(Checkin.user_id).filter(
         Checkin.challenge_id == challenge_id,
@@ -1783,7 +2117,7 @@ def api_leaderboard(challenge_id):
     checked_today_user_ids = {row.user_id for row in checked_today_rows}
 
     leaderboard = []
-    for m in challenge.members:
+    for m in members:
         leaderboard.append({
             'display_name': m.user.display_name,
             'points': m.points,
@@ -1791,16 +2125,16 @@ def api_leaderboard(challenge_id):
             'checked_in_today': m.user_id in checked_today_user_ids,
         })
 
-    leaderboard.sort(key=lambda x: -x['points'])
     return jsonify(leaderboard)
 
 
 @app.route('/api/notifications/unread-count')
 @login_required
 def api_unread_count():
-    count = Notification.query.filter_by(
-        user_id=session['user_id'],
-        is_read=False
+    # Compare against a literal false so the partial unread index matches.
+    count = Notification.query.filter(
+        Notification.user_id == session['user_id'],
+        Notification.is_read == db.false()
     ).count()
     return jsonify({'count': count})
 
@@ -1862,10 +2196,14 @@ def api_web_vitals():
 
 # --- Admin: Emergency Delete Check-in ---
 
+ADMIN_USERNAMES = frozenset(
+    u.strip() for u in os.environ.get('ADMIN_USERNAMES', '').lower().split(',') if u.strip()
+)
+
+
 def is_admin():
     """Check if current user is an admin. Set ADMIN_USERNAMES env var (comma-separated)."""
-    admin_usernames = os.environ.get('ADMIN_USERNAMES', '').lower().split(',')
-    return session.get('username', '').lower() in [u.strip() for u in admin_usernames if u.strip()]
+    return session.get('username', '').lower() in ADMIN_USERNAMES
 
 
 app.jinja_env.globals['is_admin'] = is_admin
@@ -2057,10 +2395,10 @@ def rate_limit_exceeded(e):
 # --- Database Initialization ---
 
 def init_app():
-    """Initialize the database and seed data."""
+    """Initialize the database (default achievements are seeded with their table)."""
     with app.app_context():
         db.create_all()
-        seed_achievements()
+        ensure_indexes()
 
 
 # Auto-create tables only in local dev (FLASK_DEBUG=1)
@@ -2068,7 +2406,7 @@ def init_app():
 if os.environ.get('FLASK_DEBUG') == '1':
     with app.app_context():
         db.create_all()
-        seed_achievements()
+        ensure_indexes()
 
 
 if __name__ == '__main__':
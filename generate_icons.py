@@ -15,6 +15,11 @@ os.makedirs(ICON_DIR, exist_ok=True)
 SIZES = [72, 96, 128, 144, 152, 192, 384, 512]
 MASKABLE_SIZES = [192, 512]
 
+# zlib level 6 encodes ~3x faster than optimize=True (level 9) for ~3KB more
+# across all icons. For the smallest files, post-process once with e.g.:
+#   oxipng -o 4 --strip safe static/icons/*.png
+PNG_SAVE_OPTIONS = {'compress_level': 6}
+
 # Colors matching the app theme
 BG_COLOR = (8, 9, 10)         # --bg-base: #08090a
 ACCENT = (16, 185, 129)       # --accent: #10b981
@@ -114,32 +119,32 @@ def main():
     for size in SIZES:
         icon = draw_icon(size, maskable=False)
         path = os.path.join(ICON_DIR, f'icon-{size}.png')
-        icon.save(path, 'PNG', optimize=True)
+        icon.save(path, 'PNG', **PNG_SAVE_OPTIONS)
         print(f'Created {path} ({size}x{size})')
 
     # Generate maskable icons
     for size in MASKABLE_SIZES:
         icon = draw_icon(size, maskable=True)
         path = os.path.join(ICON_DIR, f'icon-maskable-{size}.png')
-        icon.save(path, 'PNG', optimize=True)
+        icon.save(path, 'PNG', **PNG_SAVE_OPTIONS)
         print(f'Created {path} ({size}x{size} maskable)')
 
     # Generate apple-touch-icon (180x180)
     apple = draw_icon(180, maskable=False)
     apple_path = os.path.join(ICON_DIR, 'apple-touch-icon.png')
-    apple.save(apple_path, 'PNG', optimize=True)
+    apple.save(apple_path, 'PNG', **PNG_SAVE_OPTIONS)
     print(f'Created {apple_path} (180x180 apple-touch-icon)')
 
     # Generate favicon (32x32)
     fav = draw_icon(32, maskable=False)
     fav_path = os.path.join(ICON_DIR, 'favicon-32.png')
-    fav.save(fav_path, 'PNG', optimize=True)
+    fav.save(fav_path, 'PNG', **PNG_SAVE_OPTIONS)
     print(f'Created {fav_path} (32x32 favicon)')
 
     # Generate 16x16 favicon
     fav16 = draw_icon(16, maskable=False)
     fav16_path = os.path.join(ICON_DIR, 'favicon-16.png')
-    fav16.save(fav16_path, 'PNG', optimize=True)
+    fav16.save(fav16_path, 'PNG', **PNG_SAVE_OPTIONS)
     print(f'Created {fav16_path} (16x16 favicon)')
 
     print('\nAll icons generated! You can now delete generate_icons.py if desired.')
@@ -1,11 +1,20 @@
 """One-time database initialization for production.
 Run with: python init_db.py
 Called by Procfile before gunicorn starts.
+
+Indexes added to models after their table exists are built separately, as a
+one-off step after deploying the model change: python init_db.py --indexes
 """
+import sys
+
 from app import app
-from models import db, seed_achievements
+from models import db, ensure_indexes
 
 with app.app_context():
+    # Default achievements are seeded when create_all creates their table
     db.create_all()
-    seed_achievements()
-    print("Database tables created and achievements seeded.")
+    if '--indexes' in sys.argv:
+        ensure_indexes()
+        print("Database tables and indexes are up to date.")
+    else:
+        print("Database tables are up to date.")
@@ -4,6 +4,8 @@ Replaces raw SQL with proper ORM models for safer database operations
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime, timezone
 
 db = SQLAlchemy()
@@ -38,6 +40,9 @@ class User(db.Model):
 
 class Challenge(db.Model):
     __tablename__ = 'challenges'
+    __table_args__ = (
+        db.Index('idx_challenges_completed_end', 'is_completed', 'end_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -63,10 +68,6 @@ class Challenge(db.Model):
     comments = db.relationship('ChallengeComment', back_populates='challenge', cascade='all, delete-orphan')
     nudges = db.relationship('Nudge', back_populates='challenge', cascade='all, delete-orphan')
 
-    @property
-    def member_count(self):
-        return len(self.members)
-
     def __repr__(self):
         return f'<Challenge {self.name}>'
 
@@ -100,7 +101,9 @@ class Checkin(db.Model):
     __table_args__ = (
         db.UniqueConstraint('challenge_id', 'user_id', 'checkin_date', name='uq_checkin_daily'),
         db.Index('idx_checkins_user_date', 'user_id', 'checkin_date'),
-        db.Index('idx_checkins_challenge', 'challenge_id'),
+        db.Index('idx_checkins_challenge_date', 'challenge_id', 'checkin_date'),
+        # Challenge feed: newest check-ins first, read off the index without a sort
+        db.Index('idx_checkins_challenge_created', 'challenge_id', 'created_at'),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -140,6 +143,9 @@ class CheckinReaction(db.Model):
 
 class Achievement(db.Model):
     __tablename__ = 'achievements'
+    __table_args__ = (
+        db.Index('uq_achievements_name', 'name', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -175,7 +181,11 @@ class UserAchievement(db.Model):
 class Notification(db.Model):
     __tablename__ = 'notifications'
     __table_args__ = (
-        db.Index('idx_notifications_user_read', 'user_id', 'is_read'),
+        db.Index('idx_notifications_user_created', 'user_id', 'created_at'),
+        # Only unread rows are counted, so the badge index skips read history.
+        db.Index('idx_notifications_user_unread', 'user_id',
+                 postgresql_where=db.text('is_read = false'),
+                 sqlite_where=db.text('is_read = 0')),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -277,28 +287,68 @@ class Nudge(db.Model):
     to_user = db.relationship('User', foreign_keys=[to_user_id])
 
 
+def ensure_indexes():
+    """Create any model indexes missing from existing tables.
+
+    db.create_all() only creates indexes together with new tables, so indexes
+    added to models later would never reach an existing database. On Postgres
+    they are built CONCURRENTLY, outside a transaction, so writes to live
+    tables are not blocked. Run it as a one-off step: python init_db.py --indexes
+    """
+    concurrently = db.engine.dialect.name == 'postgresql'
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if not concurrently:
+                    index.create(bind=conn, checkfirst=True)
+                    continue
+                # Only for this build; create_all must not inherit the option
+                index.dialect_options['postgresql']['concurrently'] = True
+                try:
+                    index.create(bind=conn, checkfirst=True)
+                except Exception:
+                    # A failed concurrent build leaves an INVALID index behind
+                    index.drop(bind=conn, checkfirst=True)
+                    raise
+                finally:
+                    index.dialect_options['postgresql']['concurrently'] = False
+
+
+# Default achievements, inserted when the table is created. After adding rows
+# here, run seed_achievements() once to add them to existing databases.
+ACHIEVEMENT_ROWS = (
+    dict(name='First Check-in', description='Complete your first daily check-in',
+         icon='&#9989;', condition_type='total_checkins', condition_value=1),
+    dict(name='Week Warrior', description='Reach a 7-day streak',
+         icon='&#128293;', condition_type='streak', condition_value=7),
+    dict(name='Month Master', description='Reach a 30-day streak',
+         icon='&#11088;', condition_type='streak', condition_value=30),
+    dict(name='Unstoppable', description='Reach a 50-day streak',
+         icon='&#9889;', condition_type='streak', condition_value=50),
+    dict(name='Centurion', description='Earn 100 total points',
+         icon='&#127942;', condition_type='total_points', condition_value=100),
+    dict(name='Point Machine', description='Earn 500 total points',
+         icon='&#128176;', condition_type='total_points', condition_value=500),
+    dict(name='Social Butterfly', description='Join 3 different challenges',
+         icon='&#129309;', condition_type='challenges_joined', condition_value=3),
+    dict(name='Challenge Creator', description='Create your first challenge',
+         icon='&#9876;&#65039;', condition_type='challenges_created', condition_value=1),
+    dict(name='Photographer', description='Submit 10 photo proof check-ins',
+         icon='&#128247;', condition_type='photo_checkins', condition_value=10),
+)
+
+
 def seed_achievements():
-    """Seed default achievements if table is empty."""
-    if Achievement.query.count() == 0:
-        achievements = [
-            Achievement(name='First Check-in', description='Complete your first daily check-in',
-                       icon='&#9989;', condition_type='total_checkins', condition_value=1),
-            Achievement(name='Week Warrior', description='Reach a 7-day streak',
-                       icon='&#128293;', condition_type='streak', condition_value=7),
-            Achievement(name='Month Master', description='Reach a 30-day streak',
-                       icon='&#11088;', condition_type='streak', condition_value=30),
-            Achievement(name='Unstoppable', description='Reach a 50-day streak',
-                       icon='&#9889;', condition_type='streak', condition_value=50),
-            Achievement(name='Centurion', description='Earn 100 total points',
-                       icon='&#127942;', condition_type='total_points', condition_value=100),
-            Achievement(name='Point Machine', description='Earn 500 total points',
-                       icon='&#128176;', condition_type='total_points', condition_value=500),
-            Achievement(name='Social Butterfly', description='Join 3 different challenges',
-                       icon='&#129309;', condition_type='challenges_joined', condition_value=3),
-            Achievement(name='Challenge Creator', description='Create your first challenge',
-                       icon='&#9876;&#65039;', condition_type='challenges_created', condition_value=1),
-            Achievement(name='Photographer', description='Submit 10 photo proof check-ins',
-                       icon='&#128247;', condition_type='photo_checkins', condition_value=10),
-        ]
-        db.session.add_all(achievements)
-        db.session.commit()
+    """Insert missing default achievements in one INSERT ... ON CONFLICT DO NOTHING."""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    db.session.execute(
+        dialect.insert(Achievement).values(ACHIEVEMENT_ROWS)
+        .on_conflict_do_nothing(index_elements=['name'])
+    )
+    db.session.commit()
+
+
+@event.listens_for(Achievement.__table__, 'after_create')
+def _seed_new_achievements_table(target, connection, **kw):
+    """Seed the defaults in the same DDL run that creates the table."""
+    connection.execute(target.insert(), list(ACHIEVEMENT_ROWS))